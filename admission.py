@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+
+import anyio
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+# 優先度（小さいほど先に処理する）
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# 待ち時間ヒストグラムの区切り（秒）
+WAIT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0)
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    # DB を使うリクエストの同時実行数を制限し、溢れた分は優先度付きの待ち行列で待たせる。
+    # 待ち行列が一杯なら即座に拒否する。1つのイベントループからのみ使う前提。
+    def __init__(self, concurrency: int, queue_size: int, queue_timeout: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._service_time = 0.05
+        self._metrics = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "rejected_evicted": 0,
+            "max_queue_depth": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+
+    async def acquire(self, priority: int = PRIORITY_READ):
+        if self.in_flight < self.concurrency and not self._queued:
+            self.in_flight += 1
+            self._admitted(0.0)
+            return
+
+        if self._queued >= self.queue_size:
+            self._make_room(priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._queued += 1
+        self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._queued)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Python 3.12 以降の wait_for は、枠を受け取ったのと同じ周回でタイムアウトしても
+            # TimeoutError を送出する。その場合は受け取った枠を次の待機中のリクエストに渡す
+            if future.done() and not future.cancelled():
+                if future.exception() is not None:
+                    raise future.exception()
+                self.release()
+            else:
+                self._queued -= 1
+            self._metrics["rejected_timeout"] += 1
+            raise Rejected("timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # 枠を受け取った直後にクライアントが切断した場合は枠を返す
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(time.monotonic() - started)
+            elif not future.done() or future.cancelled():
+                self._queued -= 1
+            raise
+        self._admitted(time.monotonic() - started)
+
+    def release(self, service_time: float = None):
+        if service_time is not None:
+            self._service_time = 0.9 * self._service_time + 0.1 * service_time
+        # 枠は空けずに、最も優先度の高い待機中のリクエストへ直接渡す
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._queued -= 1
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        backlog = self._queued + self.in_flight
+        return max(1, math.ceil(self._service_time * backlog / self.concurrency))
+
+    def metrics(self) -> dict:
+        admitted = self._metrics["admitted"]
+        histogram = dict(zip([f"le_{bound}" for bound in WAIT_BUCKETS] + ["le_inf"], self._wait_histogram))
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            **self._metrics,
+            "wait_seconds_avg": self._metrics["wait_seconds_total"] / admitted if admitted else 0.0,
+            "wait_seconds_histogram": histogram,
+        }
+
+    def _make_room(self, priority):
+        # 待ち行列が一杯のときは、より優先度の低い待機中のリクエストがあればそれを追い出す
+        pending = [waiter for waiter in self._waiters if not waiter[2].done()]
+        worst = max(pending, default=None)
+        if worst is None or worst[0] <= priority:
+            self._metrics["rejected_queue_full"] += 1
+            raise Rejected("queue_full", self.retry_after())
+        self._waiters.remove(worst)
+        heapq.heapify(self._waiters)
+        self._queued -= 1
+        self._metrics["rejected_evicted"] += 1
+        worst[2].set_exception(Rejected("evicted", self.retry_after()))
+
+    def _admitted(self, waited):
+        self._metrics["admitted"] += 1
+        self._metrics["wait_seconds_total"] += waited
+        self._metrics["wait_seconds_max"] = max(self._metrics["wait_seconds_max"], waited)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self._wait_histogram[i] += 1
+                break
+        else:
+            self._wait_histogram[-1] += 1
+
+
+def request_priority(method: str, path: str, route_priorities=None) -> int:
+    for (route_method, prefix), priority in (route_priorities or {}).items():
+        if method == route_method and path.startswith(prefix):
+            return priority
+    return PRIORITY_READ if method in READ_METHODS else PRIORITY_WRITE
+
+
+def admission_dependency(controller: AdmissionController, route_priorities=None):
+    # DB セッションを渡す依存関係（get_db）が使う。DB を使うルートだけが制限される
+    async def admit(request: Request):
+        try:
+            await controller.acquire(request_priority(request.method, request.url.path, route_priorities))
+        except Rejected as exc:
+            raise _busy(exc)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            controller.release(time.monotonic() - started)
+
+    return admit
+
+
+@contextmanager
+def admitted(controller: AdmissionController, priority: int = PRIORITY_READ):
+    # スレッドプールで動く同期のハンドラーが、DB を使う直前に枠を取る
+    try:
+        anyio.from_thread.run(controller.acquire, priority)
+    except Rejected as exc:
+        raise _busy(exc)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        anyio.from_thread.run_sync(controller.release, time.monotonic() - started)
+
+
+def _busy(exc: Rejected):
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry later",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
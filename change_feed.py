@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event as orm_event, text
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# 購読者ごとに溜められるイベント数。溢れた購読者は切断する
+SUBSCRIBER_BUFFER = 256
+# Last-Event-ID からの再開に使う、トピックごとの直近のイベント数
+HISTORY_SIZE = 1000
+# 無通信で接続が切られないように送るコメントの間隔（秒）
+HEARTBEAT_SECONDS = 15.0
+# NOTIFY のペイロード上限（8000 バイト）に余裕を持たせた値
+NOTIFY_PAYLOAD_LIMIT = 7900
+# PostgreSQL で使うときのイベント ID の採番に使うシーケンス
+EVENT_ID_SEQUENCE = "change_feed_event_id"
+
+
+class Subscription:
+    def __init__(self, topic, loop):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_BUFFER)
+        self.dropped = False
+
+
+class Broadcaster:
+    # 受け取ったイベントをトピックの購読者全員に配る（プロセス内）。
+    # 履歴は届いた順に並べ、再開は Last-Event-ID の位置から行う（ID の大小は比較しない）
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._history = {}
+        self._callbacks = {}
+
+    def on(self, topic, callback):
+        # 届いたイベントでプロセス内の状態（索引やランキングなど）を更新する関数を登録する。
+        # PostgreSQL の場合は全ワーカーで呼ばれるので、各ワーカーの状態が揃う
+        self._callbacks.setdefault(topic, []).append(callback)
+
+    def subscribe(self, topic, last_event_id=None):
+        # 登録と履歴の取り出しを同時に行い、再開時にイベントの取りこぼしが出ないようにする
+        subscription = Subscription(topic, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            backlog = []
+            if last_event_id is not None:
+                backlog = _after(self._history.get(topic, ()), last_event_id)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.get(subscription.topic, set()).discard(subscription)
+
+    def deliver(self, topic, event):
+        # どのスレッドから呼んでもよい
+        with self._lock:
+            self._history.setdefault(topic, deque(maxlen=HISTORY_SIZE)).append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+        for callback in self._callbacks.get(topic, ()):
+            try:
+                callback(event["data"])
+            except Exception:
+                logger.exception("変更通知の反映でエラーが発生しました: %s", topic)
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(self._offer, subscription, event)
+
+    def _offer(self, subscription, event):
+        if subscription.dropped:
+            return
+        try:
+            subscription.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 読み出しが追いつかない購読者は切断し、Last-Event-ID で再接続してもらう
+            subscription.dropped = True
+            self.unsubscribe(subscription)
+
+
+class LocalTransport:
+    # 同じプロセス内の購読者にだけ届ける。テストや1ワーカー構成用。
+    # コミットされたときに、届ける順に ID を振って配る
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self._lock = threading.Lock()
+        # 再起動しても以前の ID と重ならないように起動時刻から始める
+        self._ids = itertools.count(time.time_ns() // 1000)
+
+    def publish(self, db, topic, data):
+        db.info.setdefault("change_feed", []).append((topic, data))
+
+    def committed(self, events):
+        with self._lock:
+            for topic, data in events:
+                self.broadcaster.deliver(topic, {"id": next(self._ids), "data": data})
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PostgresTransport:
+    # PostgreSQL の LISTEN/NOTIFY で全ワーカーに届ける。自分の NOTIFY も LISTEN 経由で受け取る。
+    # NOTIFY は書き込みと同じトランザクションで送るので、コミットされた順に全ワーカーへ届き、
+    # ロールバックされれば届かない。ID はシーケンスから振るので、どのワーカーでも同じになる
+    channel_prefix = "change_feed_"
+
+    def __init__(self, broadcaster, dsn, topics):
+        self.broadcaster = broadcaster
+        self.dsn = dsn
+        self.topics = list(topics)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def publish(self, db, topic, data):
+        # リクエストの DB セッションで、コミットの前に呼ぶ
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            # 大きすぎる行は ID だけを送り、クライアントに取得し直してもらう
+            payload = json.dumps({"id": data.get("id"), "truncated": True}, default=str)
+        db.execute(
+            text(
+                "SELECT pg_notify(:channel, json_build_object("
+                f"'id', nextval('{EVENT_ID_SEQUENCE}'), 'data', CAST(:payload AS json))::text)"
+            ),
+            {"channel": self.channel_prefix + topic, "payload": payload},
+        )
+
+    def committed(self, events):
+        pass
+
+    def start(self):
+        # シーケンスの作成と LISTEN は起動時に済ませ、以降の受信をスレッドで行う
+        conn = self._connect()
+        self._thread = threading.Thread(target=self._listen, args=(conn,), name="change-feed-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                # CREATE SEQUENCE IF NOT EXISTS は同時に実行すると一意制約違反になることがあるので、
+                # 全ワーカーが同時に起動しても1つずつ実行されるようにアドバイザリロックを取る
+                # （1回の実行にまとめた文は同じトランザクションで実行され、終わるとロックが外れる）
+                cursor.execute(
+                    f"SELECT pg_advisory_xact_lock(hashtext('{EVENT_ID_SEQUENCE}')); "
+                    f"CREATE SEQUENCE IF NOT EXISTS {EVENT_ID_SEQUENCE}"
+                )
+                for topic in self.topics:
+                    cursor.execute(f'LISTEN "{self.channel_prefix}{topic}"')
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _listen(self, conn):
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._receive(conn.notifies.pop(0))
+            except Exception:
+                logger.exception("変更通知の受信でエラーが発生しました")
+                self._stopped.wait(1.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+                    conn = None
+
+    def _receive(self, notify):
+        # 1件の壊れた通知で受信スレッドを止めない
+        try:
+            event = json.loads(notify.payload)
+        except ValueError:
+            logger.exception("変更通知を読み取れませんでした: %s", notify.channel)
+            return
+        self.broadcaster.deliver(notify.channel[len(self.channel_prefix):], event)
+
+
+broadcaster = Broadcaster()
+transport = LocalTransport(broadcaster)
+
+
+@orm_event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    events = session.info.pop("change_feed", None)
+    if events:
+        transport.committed(events)
+
+
+@orm_event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("change_feed", None)
+
+
+def setup(dsn, topics):
+    # CHANGE_FEED_TRANSPORT=postgres で LISTEN/NOTIFY を使う（既定はプロセス内のみ）
+    global transport
+    if os.getenv("CHANGE_FEED_TRANSPORT", "local") == "postgres":
+        transport = PostgresTransport(broadcaster, dsn, topics)
+    else:
+        transport = LocalTransport(broadcaster)
+    transport.start()
+
+
+def shutdown():
+    transport.stop()
+
+
+def publish(db, topic, data):
+    # 書き込みと同じセッションでコミットの前に呼ぶ。コミットされたときだけ配信される
+    transport.publish(db, topic, data)
+
+
+def parse_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def events(request, topic, last_event_id=None):
+    subscription, backlog = broadcaster.subscribe(topic, last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        for event in backlog:
+            yield _format(topic, event)
+        while not subscription.dropped:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield _format(topic, event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def stream_response(request, topic, last_event_id=None):
+    # EventSource は再接続時に Last-Event-ID ヘッダーを付ける。初回はクエリで指定できる
+    last_event_id = parse_event_id(request.headers.get("last-event-id")) or parse_event_id(last_event_id)
+    return StreamingResponse(
+        events(request, topic, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _after(history, last_event_id):
+    # 履歴の中で last_event_id の次からを返す。履歴にない（古すぎる、または再起動などで
+    # このワーカーが受け取っていない）場合は、取りこぼしを避けるため履歴をすべて返す
+    events = list(history)
+    for i in range(len(events) - 1, -1, -1):
+        if events[i]["id"] == last_event_id:
+            return events[i + 1:]
+    return events
+
+
+def _format(topic, event):
+    data = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {topic}\ndata: {data}\n\n"
@@ -1,10 +1,17 @@
 from sqlalchemy.orm import Session
 import models
 import schemas
+import change_feed
+from page_counts import add_rows
 
 def create_book(db: Session, book: schemas.BookCreate):
     db_book = models.BookData(**book.model_dump())
     db.add(db_book)
+    add_rows(db, "book_data")
+    db.flush()
+    # 同じトランザクションで /stream/books の購読者への配信を予約し、コミットされたら届ける
+    book_response = schemas.BookResponse.model_validate(db_book, from_attributes=True)
+    change_feed.publish(db, "books", book_response.model_dump(mode="json"))
     db.commit()
     db.refresh(db_book)
     return db_book
@@ -13,4 +20,10 @@ def get_books(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.BookData).offset(skip).limit(limit).all()
 
 def get_book_by_id(db: Session, book_id: int):
-    return db.query(models.BookData).filter(models.BookData.id == book_id).first()
\ No newline at end of file
+    return db.query(models.BookData).filter(models.BookData.id == book_id).first()
+
+def iter_book_titles(db: Session, batch_size: int = 10000):
+    # 全件をメモリに載せずに id・タイトル・著者を順に読み込む
+    return db.query(
+        models.BookData.id, models.BookData.title, models.BookData.author
+    ).yield_per(batch_size)
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+from dataclasses import dataclass, replace
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    # DB コネクションプールと、その手前の同時実行数制限をまとめた設定
+    pool_size: int = 5
+    max_overflow: int = 10
+    # 制限を通過したリクエストは必ず接続を得られるので、プールでは長く待たない
+    pool_timeout: float = 5
+    # 同時実行数の上限に対する待ち行列の長さの倍率
+    queue_factor: float = 2.0
+    # 待ち行列で待つ最大秒数
+    queue_timeout: float = 3.0
+
+    @property
+    def max_connections(self) -> int:
+        return self.pool_size + self.max_overflow
+
+    @property
+    def concurrency(self) -> int:
+        # DB を使うリクエストの同時実行数はプールの接続数と同じにする
+        return self.max_connections
+
+    @property
+    def queue_size(self) -> int:
+        return max(1, int(self.concurrency * self.queue_factor))
+
+    @staticmethod
+    def max_workers(max_connections: int, reserved: int = 5, extra_per_worker: int = 0) -> int:
+        # 1ワーカーあたり最低1本のプール接続と extra_per_worker 本の接続を使うとしたときの上限
+        return max(0, (max_connections - reserved) // (1 + extra_per_worker))
+
+    @classmethod
+    def for_workers(
+        cls, workers: int, max_connections: int, reserved: int = 5, max_per_worker: int = 40,
+        extra_per_worker: int = 0,
+    ):
+        # 全ワーカーの接続数の合計が DB の max_connections を超えないように分ける。
+        # extra_per_worker はプールの外で各ワーカーが使う接続（変更通知の LISTEN など）。
+        # 同期ハンドラーのスレッドプール（既定 40）より多くの接続は使われない
+        per_worker = min((max_connections - reserved) // workers - extra_per_worker, max_per_worker)
+        if per_worker < 1:
+            raise ValueError(
+                f"max_connections={max_connections} is too small for {workers} workers"
+            )
+        pool_size = max(1, per_worker * 2 // 3)
+        return replace(cls.from_env(), pool_size=pool_size, max_overflow=per_worker - pool_size)
+
+    def to_env(self) -> dict:
+        return {
+            "DB_POOL_SIZE": str(self.pool_size),
+            "DB_MAX_OVERFLOW": str(self.max_overflow),
+            "DB_POOL_TIMEOUT": str(self.pool_timeout),
+            "DB_QUEUE_FACTOR": str(self.queue_factor),
+            "DB_QUEUE_TIMEOUT": str(self.queue_timeout),
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            pool_size=int(os.getenv("DB_POOL_SIZE", cls.pool_size)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", cls.max_overflow)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", cls.pool_timeout)),
+            queue_factor=float(os.getenv("DB_QUEUE_FACTOR", cls.queue_factor)),
+            queue_timeout=float(os.getenv("DB_QUEUE_TIMEOUT", cls.queue_timeout)),
+        )
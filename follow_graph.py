@@ -0,0 +1,216 @@
+import sys
+import threading
+
+import numpy as np
+
+# 差分がこの件数を超えたら CSR を作り直す
+COMPACT_THRESHOLD = 50_000
+
+
+class _Csr:
+    # ノードごとの隣接ノードをソート済みの int32 配列にまとめた隣接リスト
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def build(cls, src, dst, size):
+        order = np.lexsort((dst, src))
+        src, dst = src[order], dst[order]
+        if len(src):
+            # 重複したフォローは1本にまとめる
+            unique = np.ones(len(src), dtype=bool)
+            unique[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+            src, dst = src[unique], dst[unique]
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=size), out=indptr[1:])
+        return cls(indptr, dst.astype(np.int32))
+
+    @property
+    def size(self):
+        return len(self.indptr) - 1
+
+    def row(self, node):
+        if node >= self.size:
+            return self.indices[:0]
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def contains(self, node, other):
+        row = self.row(node)
+        i = np.searchsorted(row, other)
+        return i < len(row) and row[i] == other
+
+    def edges(self):
+        src = np.repeat(np.arange(self.size, dtype=np.int32), np.diff(self.indptr))
+        return src, self.indices
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+
+class FollowGraph:
+    # follows テーブルをメモリ上の CSR に読み込み、フォロー/解除は差分として反映する
+    def __init__(self, compact_threshold: int = COMPACT_THRESHOLD):
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._ids = []
+        self._index = {}
+        self._reset(_Csr.build(np.empty(0, np.int32), np.empty(0, np.int32), 0))
+
+    def load(self, edges):
+        # edges は (follower_id, following_id) を順に返すイテラブル（ストリーミング読み込みを想定）
+        with self._lock:
+            self._ids = []
+            self._index = {}
+            pairs = np.fromiter(
+                (value for follower_id, following_id in edges
+                 for value in (self._node(follower_id), self._node(following_id))),
+                dtype=np.int32,
+            ).reshape(-1, 2)
+            self._reset(_Csr.build(pairs[:, 0], pairs[:, 1], len(self._ids)))
+
+    def follow(self, follower_id, following_id):
+        with self._lock:
+            a, b = self._node(follower_id), self._node(following_id)
+            if b in self._removed.get(a, ()):
+                self._discard(self._removed, a, b)
+            elif not self._following.contains(a, b):
+                self._added.setdefault(a, set()).add(b)
+                self._added_in.setdefault(b, set()).add(a)
+            self._changed()
+
+    def unfollow(self, follower_id, following_id):
+        with self._lock:
+            a, b = self._node(follower_id), self._node(following_id)
+            if b in self._added.get(a, ()):
+                self._discard(self._added, a, b)
+            elif self._following.contains(a, b):
+                self._removed.setdefault(a, set()).add(b)
+                self._removed_in.setdefault(b, set()).add(a)
+            self._changed()
+
+    def follows(self, follower_id, following_id) -> bool:
+        with self._lock:
+            a, b = self._index.get(follower_id), self._index.get(following_id)
+            if a is None or b is None:
+                return False
+            if b in self._added.get(a, ()):
+                return True
+            if b in self._removed.get(a, ()):
+                return False
+            return bool(self._following.contains(a, b))
+
+    def mutuals(self, user_id, other_id) -> list:
+        # user_id がフォローしていて、かつ other_id をフォローしているユーザー
+        with self._lock:
+            a, b = self._index.get(user_id), self._index.get(other_id)
+            if a is None or b is None:
+                return []
+            common = np.intersect1d(self._out(a), self._in(b), assume_unique=True)
+            return [self._ids[node] for node in common]
+
+    def suggestions(self, user_id, limit: int = 10) -> list:
+        # フォロー中のユーザーがフォローしている人を、共通フォロー数の多い順に返す
+        with self._lock:
+            a = self._index.get(user_id)
+            if a is None:
+                return []
+            following = self._out(a)
+            if not len(following):
+                return []
+            reachable = np.concatenate([self._out(node) for node in following])
+            candidates, counts = np.unique(reachable, return_counts=True)
+            keep = (candidates != a) & ~np.isin(candidates, following, assume_unique=True)
+            candidates, counts = candidates[keep], counts[keep]
+            order = np.lexsort((candidates, -counts))[:limit]
+            return [(self._ids[candidates[i]], int(counts[i])) for i in order]
+
+    def compact(self):
+        with self._lock:
+            src, dst = self._following.edges()
+            if self._removed:
+                removed = np.fromiter(
+                    ((a << 32) | b for a, others in self._removed.items() for b in others),
+                    dtype=np.int64,
+                )
+                keep = ~np.isin((src.astype(np.int64) << 32) | dst, removed)
+                src, dst = src[keep], dst[keep]
+            added = np.fromiter(
+                (value for a, others in self._added.items() for b in others for value in (a, b)),
+                dtype=np.int32,
+            ).reshape(-1, 2)
+            src = np.concatenate([src, added[:, 0]])
+            dst = np.concatenate([dst, added[:, 1]])
+            self._reset(_Csr.build(src, dst, len(self._ids)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            edges = len(self._following.indices)
+            array_bytes = self._following.nbytes + self._followers.nbytes
+            id_map_bytes = self._id_map_bytes()
+            total_bytes = array_bytes + id_map_bytes
+            return {
+                "users": len(self._ids),
+                "edges": edges,
+                "pending_deltas": self._delta_count,
+                "array_bytes": array_bytes,
+                "id_map_bytes": id_map_bytes,
+                "total_bytes": total_bytes,
+                "bytes_per_million_edges": total_bytes * 1_000_000 // edges if edges else 0,
+            }
+
+    def _id_map_bytes(self):
+        # ノード番号 ⇔ ユーザー ID の対応（リスト・辞書と ID のオブジェクト自体）。
+        # ID はどれも同じ大きさなので、先頭の1つから見積もる
+        size = sys.getsizeof(self._ids) + sys.getsizeof(self._index)
+        if self._ids:
+            sample = self._ids[0]
+            per_id = sys.getsizeof(sample) + sys.getsizeof(getattr(sample, "int", 0))
+            size += per_id * len(self._ids)
+        return size
+
+    def _reset(self, following):
+        src, dst = following.edges()
+        self._following = following
+        self._followers = _Csr.build(dst, src, following.size)
+        self._added = {}
+        self._removed = {}
+        self._added_in = {}
+        self._removed_in = {}
+        self._delta_count = 0
+
+    def _node(self, user_id):
+        node = self._index.get(user_id)
+        if node is None:
+            node = self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+        return node
+
+    def _discard(self, deltas, a, b):
+        reverse = self._added_in if deltas is self._added else self._removed_in
+        for table, key, value in ((deltas, a, b), (reverse, b, a)):
+            table[key].discard(value)
+            if not table[key]:
+                del table[key]
+
+    def _changed(self):
+        self._delta_count += 1
+        if self._delta_count >= self.compact_threshold:
+            self.compact()
+
+    def _merge(self, base, added, removed):
+        if removed:
+            base = base[~np.isin(base, np.fromiter(removed, dtype=np.int32))]
+        if added:
+            base = np.union1d(base, np.fromiter(added, dtype=np.int32))
+        return base
+
+    def _out(self, node):
+        return self._merge(self._following.row(node), self._added.get(node), self._removed.get(node))
+
+    def _in(self, node):
+        return self._merge(self._followers.row(node), self._added_in.get(node), self._removed_in.get(node))
+
+
+graph = FollowGraph()
@@ -0,0 +1,143 @@
+import enum
+import heapq
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+
+class PopularWindow(str, enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+    ALL = "all"
+
+
+class PopularBy(str, enum.Enum):
+    SHELVED = "shelved"
+    REVIEWED = "reviewed"
+    FAVORITED = "favorited"
+
+
+# 集計期間（None は全期間）
+WINDOW_SPANS = {
+    PopularWindow.DAY: timedelta(days=1),
+    PopularWindow.WEEK: timedelta(days=7),
+    PopularWindow.ALL: None,
+}
+
+# カウンターのバケット幅
+BUCKET_SPAN = timedelta(hours=1)
+
+
+def bucket_start(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+class _WindowCounter:
+    # 1時間単位のバケットと、期間内の合計を差分で保持する
+    def __init__(self, span):
+        self.span = span
+        self.buckets = deque()  # (バケット開始時刻, Counter) を古い順に保持
+        self.totals = Counter()
+
+    def add(self, book_id, delta, at):
+        if self.span is not None:
+            start = bucket_start(at)
+            if start <= bucket_start(datetime.utcnow()) - self.span:
+                return
+            bucket = self._bucket(start)
+            bucket[book_id] += delta
+        self._add_total(book_id, delta)
+
+    def expire(self, now):
+        if self.span is None:
+            return
+        limit = bucket_start(now) - self.span
+        while self.buckets and self.buckets[0][0] <= limit:
+            _, bucket = self.buckets.popleft()
+            for book_id, count in bucket.items():
+                self._add_total(book_id, -count)
+
+    def _bucket(self, start):
+        # 通常は末尾への追加のみ。ウォームアップ時の古い時刻は前方を探す
+        for i in range(len(self.buckets) - 1, -1, -1):
+            existing_start, bucket = self.buckets[i]
+            if existing_start == start:
+                return bucket
+            if existing_start < start:
+                self.buckets.insert(i + 1, (start, Counter()))
+                return self.buckets[i + 1][1]
+        self.buckets.appendleft((start, Counter()))
+        return self.buckets[0][1]
+
+    def _add_total(self, book_id, delta):
+        # 合計は常にバケットの総和と一致させる（お気に入り解除で負になることもある）
+        count = self.totals[book_id] + delta
+        if count:
+            self.totals[book_id] = count
+        else:
+            del self.totals[book_id]
+
+
+class Leaderboard:
+    # 本棚追加・レビュー・お気に入りの件数を時間バケットで増分集計し、
+    # 上位 K 件はバックグラウンドのスレッドが一定間隔で再計算する
+    def __init__(self, top_k: int = 100, refresh_interval: float = 5.0):
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._counters = {
+            (window, by): _WindowCounter(span)
+            for window, span in WINDOW_SPANS.items()
+            for by in PopularBy
+        }
+        self._top = {key: [] for key in self._counters}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.refresh()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def record(self, by: PopularBy, book_id, delta: int = 1, at: datetime = None, windows=tuple(PopularWindow)):
+        # windows は読み込み時に、時間別の件数と全期間の件数を別々に入れるために使う
+        at = at or datetime.utcnow()
+        with self._lock:
+            for window in windows:
+                self._counters[(PopularWindow(window), PopularBy(by))].add(book_id, delta, at)
+
+    def top(self, window: PopularWindow, by: PopularBy, limit: int = 10):
+        # 計算済みのリストを返すだけなので O(K)
+        return self._top[(PopularWindow(window), PopularBy(by))][:min(limit, self.top_k)]
+
+    def counts(self, window: PopularWindow, by: PopularBy) -> dict:
+        return dict(self._snapshot((PopularWindow(window), PopularBy(by))))
+
+    def refresh(self):
+        for key in self._counters:
+            totals = self._snapshot(key)
+            # 集計はロックの外で行い、record() を待たせない
+            self._top[key] = heapq.nlargest(
+                self.top_k, ((book_id, count) for book_id, count in totals if count > 0), key=itemgetter(1)
+            )
+
+    def _snapshot(self, key):
+        # ロック中は期限切れのバケットの除去と合計のコピーだけを行う
+        with self._lock:
+            counter = self._counters[key]
+            counter.expire(datetime.utcnow())
+            return list(counter.totals.items())
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+
+board = Leaderboard()
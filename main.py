@@ -1,9 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 import crud
 import models
 import schemas
-from database import engine, get_db
+import change_feed
+from database import engine, get_db, SessionLocal
+from prefix_index import PrefixIndex
+from page_counts import PAGE_HEADERS, paginate, seed_counts, table_total
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -22,18 +25,83 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # すべてのHTTPメソッドを許可
     allow_headers=["*"],  # すべてのヘッダーを許可
+    expose_headers=PAGE_HEADERS,  # 一覧の件数をフロントエンドから読めるようにする
 )
 
+# 新しい本の変更通知（複数ワーカー間は CHANGE_FEED_TRANSPORT=postgres で共有する）。
+# 索引の読み込み中に追加された本も取りこぼさないように、読み込みより先に受信を始める
+@app.on_event("startup")
+def start_change_feed():
+    change_feed.setup(engine.url.render_as_string(hide_password=False), ["books"])
+
+@app.on_event("shutdown")
+def stop_change_feed():
+    change_feed.shutdown()
+
+# 一覧の総件数は table_counts に保持し、本の追加と同じトランザクションで増やす
+@app.on_event("startup")
+def seed_page_counts():
+    db = SessionLocal()
+    try:
+        seed_counts(db, ["book_data"])
+    finally:
+        db.close()
+
+# タイトル・著者の入力補完用の索引。book_data には本棚登録のような人気の指標がないため、
+# 一致したキーの短い順、追加した順に並ぶ
+suggest_index = PrefixIndex()
+
+def suggest_entry(book_id, title, author):
+    return book_id, {"id": book_id, "title": title, "author": author}, title, author
+
+# 起動時に全ての本を読み込んで索引を作る
+@app.on_event("startup")
+def load_suggest_index():
+    db = SessionLocal()
+    try:
+        suggest_index.load(suggest_entry(*row) for row in crud.iter_book_titles(db))
+    finally:
+        db.close()
+
+# 追加された本は変更通知を受け取ったワーカーそれぞれが索引に入れる（大きすぎて ID だけが
+# 届いた本は、次の起動時の読み込みで索引に入る）
+def index_book(data):
+    if not data.get("truncated"):
+        suggest_index.add(*suggest_entry(data["id"], data["title"], data["author"]))
+
+change_feed.broadcaster.on("books", index_book)
+
+# 追加された本を Server-Sent Events で配信するエンドポイント
+@app.get("/stream/books")
+async def stream_books(request: Request, last_event_id: str = None):
+    return change_feed.stream_response(request, "books", last_event_id)
+
 # 本を追加するエンドポイント
 @app.post("/books/", response_model=schemas.BookResponse)
 def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
     return crud.create_book(db=db, book=book)
 
 # 全ての本を取得するエンドポイント
+# include_total / approximate を指定すると総件数を X-Total-Count ヘッダーで返す
 @app.get("/books/", response_model=list[schemas.BookResponse])
-def read_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    books = crud.get_books(db, skip=skip, limit=limit)
-    return books
+def read_books(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    include_total: bool = False,
+    approximate: bool = False,
+    db: Session = Depends(get_db)
+):
+    books = crud.get_books(db, skip=skip, limit=limit + 1)
+    total, estimated = None, False
+    if include_total or approximate:
+        total, estimated = table_total(db, "book_data", approximate)
+    return paginate(response, books, limit, total, estimated)
+
+# タイトル・著者の前方一致で入力候補を返すエンドポイント
+@app.get("/books/suggest", response_model=list[schemas.BookSuggestion])
+def suggest_books(prefix: str, limit: int = Query(10, ge=1, le=suggest_index.top_k)):
+    return suggest_index.suggest(prefix, limit)
 
 # IDで本を取得するエンドポイント
 @app.get("/books/{book_id}", response_model=schemas.BookResponse)
@@ -17,7 +17,7 @@
 #     book_url=Column(String)
 #     created_at = Column(DateTime)
 
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime
 from database import Base
 from datetime import datetime
 
@@ -31,4 +31,11 @@ class BookData(Base):
     isbn = Column(String)
     price = Column(Float)
     description = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# テーブル全体の件数（行の追加と同じトランザクションで増やす）
+class TableCount(Base):
+    __tablename__ = 'table_counts'
+
+    table_name = Column(String, primary_key=True)
+    row_count = Column(BigInteger, nullable=False, default=0)
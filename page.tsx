@@ -1,6 +1,6 @@
 'use client'
 
-import { useState, FormEvent } from 'react'
+import { useState, useRef, useEffect, FormEvent } from 'react'
 
 // 型定義
 interface Book {
@@ -12,6 +12,18 @@ interface Book {
   description: string
 }
 
+// 入力補完の候補
+interface BookSuggestion {
+  id: number
+  title: string
+  author: string | null
+}
+
+type SuggestField = 'title' | 'author'
+
+// 入力が止まってから候補を取得するまでの時間（ミリ秒）
+const SUGGEST_DELAY_MS = 150
+
 export default function BookCreatePage() {
   // フォーム状態の初期値
   const [bookData, setBookData] = useState<Book>({
@@ -22,6 +34,55 @@ export default function BookCreatePage() {
     price: 0,
     description: ''
   })
+  const [titleSuggestions, setTitleSuggestions] = useState<BookSuggestion[]>([])
+  const [authorSuggestions, setAuthorSuggestions] = useState<BookSuggestion[]>([])
+  // 入力欄ごとの待機中のタイマーと実行中のリクエスト
+  const suggestTimers = useRef<Partial<Record<SuggestField, ReturnType<typeof setTimeout>>>>({})
+  const suggestRequests = useRef<Partial<Record<SuggestField, AbortController>>>({})
+
+  // 画面を離れるときに待機中の取得を止める
+  useEffect(() => () => {
+    Object.values(suggestTimers.current).forEach(timer => clearTimeout(timer))
+    Object.values(suggestRequests.current).forEach(controller => controller?.abort())
+  }, [])
+
+  const setSuggestionsFor = (field: SuggestField) =>
+    field === 'title' ? setTitleSuggestions : setAuthorSuggestions
+
+  // 入力のたびに前回の取得を取り消し、入力が止まってから候補を取得する
+  const scheduleSuggestions = (field: SuggestField, prefix: string) => {
+    clearTimeout(suggestTimers.current[field])
+    suggestRequests.current[field]?.abort()
+    if (!prefix.trim()) {
+      setSuggestionsFor(field)([])
+      return
+    }
+    suggestTimers.current[field] = setTimeout(() => fetchSuggestions(field, prefix), SUGGEST_DELAY_MS)
+  }
+
+  // タイトル・著者の入力候補を取得
+  const fetchSuggestions = async (field: SuggestField, prefix: string) => {
+    const controller = new AbortController()
+    suggestRequests.current[field] = controller
+
+    try {
+      const response = await fetch(
+        `http://127.0.0.1:8000/books/suggest?prefix=${encodeURIComponent(prefix)}&limit=8`,
+        { signal: controller.signal }
+      )
+      if (response.ok) {
+        const suggestions: BookSuggestion[] = await response.json()
+        // 後から入力された内容の取得が始まっていれば、古い応答は捨てる
+        if (!controller.signal.aborted) {
+          setSuggestionsFor(field)(suggestions)
+        }
+      }
+    } catch (error) {
+      if (!controller.signal.aborted) {
+        console.error('候補の取得に失敗しました:', error)
+      }
+    }
+  }
 
   // 送信ハンドラー
   const handleSubmit = async (e: FormEvent<HTMLFormElement>) => {
@@ -68,6 +129,10 @@ export default function BookCreatePage() {
       ...prev,
       [name]: formattedValue
     }))
+
+    if (name === 'title' || name === 'author') {
+      scheduleSuggestions(name, value)
+    }
   }
 
   return (
@@ -82,9 +147,18 @@ export default function BookCreatePage() {
             name="title"
             value={bookData.title}
             onChange={handleChange}
+            list="book-title-suggestions"
+            autoComplete="off"
             required
             className="w-full px-3 py-2 border rounded-md"
           />
+          <datalist id="book-title-suggestions">
+            {titleSuggestions.map(suggestion => (
+              <option key={suggestion.id} value={suggestion.title}>
+                {suggestion.author}
+              </option>
+            ))}
+          </datalist>
         </div>
 
         <div>
@@ -94,9 +168,16 @@ export default function BookCreatePage() {
             name="author"
             value={bookData.author}
             onChange={handleChange}
+            list="book-author-suggestions"
+            autoComplete="off"
             required
             className="w-full px-3 py-2 border rounded-md"
           />
+          <datalist id="book-author-suggestions">
+            {Array.from(new Set(authorSuggestions.map(suggestion => suggestion.author).filter(Boolean))).map(author => (
+              <option key={author} value={author as string} />
+            ))}
+          </datalist>
         </div>
 
         <div>
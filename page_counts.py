@@ -0,0 +1,61 @@
+from sqlalchemy import text
+
+# 一覧のページ情報として返すレスポンスヘッダー
+PAGE_HEADERS = ["X-Total-Count", "X-Total-Count-Approximate", "X-Has-More"]
+
+# テーブル全体の件数は table_counts（table_name, row_count）に保持する。
+# 行を追加・削除するトランザクションの中で add_rows() を呼び、同じコミットで件数も更新する
+
+
+def seed_counts(db, tables):
+    # まだ件数の行がないテーブルだけを一度だけ数える（既にあれば COUNT は実行されない）
+    for table in tables:
+        db.execute(
+            text(
+                f"INSERT INTO table_counts (table_name, row_count) "
+                f"SELECT :table, (SELECT count(*) FROM {table}) "
+                f"WHERE NOT EXISTS (SELECT 1 FROM table_counts WHERE table_name = :table) "
+                f"ON CONFLICT (table_name) DO NOTHING"
+            ),
+            {"table": table},
+        )
+    db.commit()
+
+
+def add_rows(db, table: str, delta: int = 1):
+    # コミット前に呼ぶ。ロールバックされれば件数も元に戻る
+    db.execute(
+        text("UPDATE table_counts SET row_count = row_count + :delta WHERE table_name = :table"),
+        {"table": table, "delta": delta},
+    )
+
+
+def estimate_rows(db, table: str):
+    # プランナーの推定行数。ANALYZE されていないテーブルは -1 になるので None を返す
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+        {"table": table},
+    ).scalar()
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+def table_total(db, table: str, approximate: bool = False):
+    # (件数, 推定値かどうか) を返す。件数の行がなければ推定値を使う
+    if not approximate:
+        count = db.execute(
+            text("SELECT row_count FROM table_counts WHERE table_name = :table"),
+            {"table": table},
+        ).scalar()
+        if count is not None:
+            return count, False
+    return estimate_rows(db, table), True
+
+
+def paginate(response, rows, limit: int, total=None, approximate: bool = False):
+    # rows は limit + 1 件取得したもの。余分な1件があれば次のページがある
+    response.headers["X-Has-More"] = "true" if len(rows) > limit else "false"
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+        if approximate:
+            response.headers["X-Total-Count-Approximate"] = "true"
+    return rows[:limit]
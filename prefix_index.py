@@ -0,0 +1,172 @@
+import bisect
+import heapq
+import itertools
+import threading
+import unicodedata
+
+# 一致するキーがこれより多い前方一致は、上位の結果を事前に計算して保持する
+HEAVY_PREFIX = 256
+
+# カタカナ（ァ〜ヶ）をひらがなに変換する表
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+MAX_CHAR = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    # NFKC で全角/半角を揃え、カタカナをひらがなに寄せ、大文字小文字と空白の違いを無視する
+    text = unicodedata.normalize("NFKC", text).casefold().translate(KATAKANA_TO_HIRAGANA)
+    return "".join(text.split())
+
+
+class PrefixIndex:
+    # 正規化したキーをソート済み配列で持ち、二分探索で前方一致を引く。
+    # 一致が多い前方一致は上位 top_k 件の2倍を事前に計算しておき、人気の変化や本の追加の
+    # たびにその場で更新する。並び順は人気の高い順、一致したキーの短い順、追加した順
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.capacity = top_k * 2
+        self._lock = threading.Lock()
+        self._entries = []  # (キー, 本の ID) のソート済み配列
+        self._items = {}
+        self._keys = {}
+        self._popularity = {}
+        self._order = {}
+        self._sequence = itertools.count()
+        self._top = {}  # 前方一致 → [(順位, 本の ID), ...]（順位の昇順）
+
+    def load(self, rows, popularity=None):
+        # rows は (本の ID, 返却する内容, 索引にする文字列...) を順に返すイテラブル
+        entries = []
+        with self._lock:
+            for item_id, item, *texts in rows:
+                self._items[item_id] = item
+                self._keys[item_id] = keys = _keys(texts)
+                self._order.setdefault(item_id, next(self._sequence))
+                entries.extend((key, item_id) for key in keys)
+            self._popularity.update(popularity or {})
+            entries.extend(self._entries)
+            entries.sort()
+            self._entries = entries
+            self._build()
+
+    def add(self, item_id, item, *texts):
+        with self._lock:
+            self._items[item_id] = item
+            self._keys[item_id] = keys = _keys(texts)
+            self._order.setdefault(item_id, next(self._sequence))
+            for key in keys:
+                bisect.insort(self._entries, (key, item_id))
+            self._update(item_id, improved=True)
+
+    def set_popularity(self, item_id, popularity):
+        with self._lock:
+            previous = self._popularity.get(item_id, 0)
+            self._popularity[item_id] = popularity
+            self._update(item_id, improved=popularity >= previous)
+
+    def bump(self, item_id, delta: int = 1):
+        with self._lock:
+            self._popularity[item_id] = self._popularity.get(item_id, 0) + delta
+            self._update(item_id, improved=delta >= 0)
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        # 保持している上位件数を超える limit は、一致する範囲全体の走査になるので受け付けない
+        limit = min(limit, self.top_k)
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None or limit > len(top):
+                lo = bisect.bisect_left(self._entries, (prefix,))
+                hi = bisect.bisect_left(self._entries, (prefix + MAX_CHAR,), lo)
+                top = self._rank_range(prefix, lo, hi, self.capacity)
+                if hi - lo > HEAVY_PREFIX:
+                    self._top[prefix] = top[:self.capacity]
+            return [self._items[item_id] for _, item_id in top[:limit]]
+
+    def _rank(self, item_id, prefix):
+        length = min(len(key) for key in self._keys[item_id] if key.startswith(prefix))
+        return -self._popularity.get(item_id, 0), length, self._order[item_id]
+
+    def _rank_range(self, prefix, lo, hi, n):
+        # _entries[lo:hi] を走査して上位 n 件を求める（同じ本は一番短いキーで並べる）
+        lengths = {}
+        for key, item_id in self._entries[lo:hi]:
+            if len(key) < lengths.get(item_id, len(key) + 1):
+                lengths[item_id] = len(key)
+        return heapq.nsmallest(n, (
+            ((-self._popularity.get(item_id, 0), length, self._order[item_id]), item_id)
+            for item_id, length in lengths.items()
+        ))
+
+    def _build(self):
+        # 1文字目ごとに、一致の多い前方一致の上位を子（次の1文字）の上位から組み立てる
+        self._top = {}
+        lo = 0
+        while lo < len(self._entries):
+            hi = bisect.bisect_left(self._entries, (self._entries[lo][0][:1] + MAX_CHAR,), lo)
+            self._collect(lo, hi, 1)
+            lo = hi
+
+    def _collect(self, lo, hi, depth):
+        entries = self._entries
+        prefix = entries[lo][0][:depth]
+        if hi - lo <= HEAVY_PREFIX:
+            return self._rank_range(prefix, lo, hi, self.capacity)
+
+        # 前方一致の上位は、キーが prefix そのものの本と各子の上位の中に必ず含まれる
+        best = {}
+        i = lo
+        while i < hi:
+            key = entries[i][0]
+            if len(key) == depth:
+                end = i
+                while end < hi and entries[end][0] == prefix:
+                    end += 1
+                ranked = self._rank_range(prefix, i, end, self.capacity)
+            else:
+                end = bisect.bisect_left(entries, (key[:depth + 1] + MAX_CHAR,), i, hi)
+                ranked = self._collect(i, end, depth + 1)
+            for rank, item_id in ranked:
+                if rank < best.get(item_id, rank + (1,)):
+                    best[item_id] = rank
+            i = end
+        top = heapq.nsmallest(self.capacity, ((rank, item_id) for item_id, rank in best.items()))
+        self._top[prefix] = top
+        return top
+
+    def _update(self, item_id, improved):
+        # 本のキーの前方一致のうち、上位を保持しているものだけをその場で直す
+        prefixes = {key[:end] for key in self._keys.get(item_id, ()) for end in range(1, len(key) + 1)}
+        for prefix in prefixes:
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            listed = False
+            for i, (_, other_id) in enumerate(top):
+                if other_id == item_id:
+                    del top[i]
+                    listed = True
+                    break
+            entry = (self._rank(item_id, prefix), item_id)
+            if (listed and improved) or (top and entry < top[-1]):
+                # 上位に入っていた本が上がった場合と、最下位より上になった場合だけ入れる
+                bisect.insort(top, entry)
+                del top[self.capacity:]
+            elif listed and len(top) < self.top_k:
+                # 保持している件数が足りなくなったら、次の検索で数え直す
+                del self._top[prefix]
+
+
+def _keys(texts):
+    # 全体と、空白で区切った単語それぞれを索引にする
+    keys = set()
+    for text in texts:
+        if not text:
+            continue
+        keys.add(normalize(text))
+        keys.update(normalize(word) for word in text.split())
+    keys.discard("")
+    return keys
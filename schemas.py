@@ -10,6 +10,11 @@ class BookCreate(BaseModel):
     price: Optional[float] = None
     description: Optional[str] = None
 
+class BookSuggestion(BaseModel):
+    id: int
+    title: str
+    author: Optional[str] = None
+
 class BookResponse(BookCreate):
     id: int
     created_at: datetime
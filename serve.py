@@ -0,0 +1,170 @@
+import argparse
+import http.client
+import importlib.util
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from db_config import PoolConfig
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def run(args):
+    import uvicorn
+
+    # 入力補完の索引や人気ランキングなどはワーカーごとにメモリに持つので、
+    # 複数ワーカーでは LISTEN/NOTIFY で変更を全ワーカーに届けて揃える
+    transport = os.getenv("CHANGE_FEED_TRANSPORT") or ("postgres" if args.workers > 1 else "local")
+    os.environ["CHANGE_FEED_TRANSPORT"] = transport
+    # LISTEN の接続はプールの外で各ワーカーが1本ずつ使う
+    listeners = 1 if transport == "postgres" else 0
+    # ワーカーはこのプロセスの環境変数を引き継ぎ、PoolConfig.from_env() で読み込む
+    pool = PoolConfig.for_workers(
+        args.workers, args.db_max_connections, args.db_reserved_connections, extra_per_worker=listeners
+    )
+    os.environ.update(pool.to_env())
+    total = args.workers * (pool.max_connections + listeners)
+    print(
+        f"{args.workers} workers, pool_size={pool.pool_size}, max_overflow={pool.max_overflow} "
+        f"({total}/{args.db_max_connections} connections including {args.workers * listeners} listeners), "
+        f"loop={event_loop()}, http={http_protocol()}, "
+        f"change_feed={os.getenv('CHANGE_FEED_TRANSPORT', 'local')}"
+    )
+
+    # SIGTERM を受けると新規接続を止め、処理中のリクエストを drain_timeout 秒まで待つ。
+    # SIGHUP で全ワーカーを順に再起動し、落ちたワーカーは自動で起動し直される
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=event_loop(),
+        http=http_protocol(),
+        timeout_graceful_shutdown=args.drain_timeout,
+        limit_max_requests=args.max_requests,
+        access_log=False,
+    )
+
+
+def wait_until_ready(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not start within {timeout}s")
+
+
+def load(host, port, path, duration, concurrency):
+    # 各スレッドが keep-alive の接続で GET を送り続ける
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        local = []
+        failed = 0
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                else:
+                    local.append(time.monotonic() - started)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def bench(args):
+    counts = sorted({1, args.workers} | {2 ** i for i in range(1, args.workers.bit_length()) if 2 ** i < args.workers})
+    print(f"GET {args.bench_path} for {args.bench_duration}s with {args.bench_concurrency} connections")
+    print(f"{'workers':>7} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    client_host = "127.0.0.1" if args.host == "0.0.0.0" else args.host
+    baseline = None
+    for workers in counts:
+        server = subprocess.Popen([
+            sys.executable, __file__, args.app,
+            "--host", args.host, "--port", str(args.port), "--workers", str(workers),
+            "--db-max-connections", str(args.db_max_connections),
+            "--db-reserved-connections", str(args.db_reserved_connections),
+        ])
+        try:
+            wait_until_ready(client_host, args.port)
+            # ウォームアップ
+            load(client_host, args.port, args.bench_path, 1.0, args.bench_concurrency)
+            latencies, errors = load(
+                client_host, args.port, args.bench_path, args.bench_duration, args.bench_concurrency
+            )
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+        throughput = len(latencies) / args.bench_duration
+        baseline = baseline or throughput
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+        speedup = throughput / baseline if baseline else 0.0
+        print(f"{workers:>7} {throughput:>10.1f} {speedup:>7.2f}x {p50:>8.2f} {p99:>8.2f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API サーバーを複数ワーカーで起動する")
+    parser.add_argument("app", nargs="?", default="main:app", help="起動するアプリ（module:attribute）")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="既定は CPU 数（接続数の上限まで）")
+    parser.add_argument("--db-max-connections", type=int, default=100, help="DB の max_connections")
+    parser.add_argument("--db-reserved-connections", type=int, default=5, help="管理用などに残しておく接続数")
+    parser.add_argument("--drain-timeout", type=int, default=30, help="停止時に処理中のリクエストを待つ秒数")
+    parser.add_argument("--max-requests", type=int, default=None, help="この件数を処理したワーカーを再起動する")
+    parser.add_argument("--bench", action="store_true", help="1 から --workers までのスループットを計測する")
+    parser.add_argument("--bench-path", default="/books/")
+    parser.add_argument("--bench-duration", type=float, default=10.0)
+    parser.add_argument("--bench-concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.workers is None:
+        # CPU 数が多いホストでも、LISTEN の接続を含めて max_connections に収まる数までにする
+        limit = PoolConfig.max_workers(args.db_max_connections, args.db_reserved_connections, extra_per_worker=1)
+        args.workers = max(1, min(os.cpu_count() or 1, limit))
+
+    if args.bench:
+        bench(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, Rejected
+
+
+def test_slot_handed_over_at_timeout_is_passed_on(monkeypatch):
+    # release() が枠を渡したのと同じ周回でタイムアウトした場合（Python 3.12 以降の wait_for）
+    controller = AdmissionController(concurrency=1, queue_size=4, queue_timeout=1.0)
+
+    async def wait_for_then_timeout(future, timeout):
+        controller.release()
+        assert future.done()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await controller.acquire()
+        monkeypatch.setattr(admission.asyncio, "wait_for", wait_for_then_timeout)
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.reason == "timeout"
+        monkeypatch.undo()
+
+        # 枠は失われず、待ち行列も空に戻っている
+        assert controller.in_flight == 0
+        assert controller.metrics()["queue_depth"] == 0
+        await asyncio.wait_for(controller.acquire(), 0.1)
+        assert controller.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_timeout_while_queued_is_rejected():
+    controller = AdmissionController(concurrency=1, queue_size=4, queue_timeout=0.01)
+
+    async def scenario():
+        await controller.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.reason == "timeout"
+        assert controller.metrics()["queue_depth"] == 0
+        controller.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())